@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# @Author  : xuelun
+
+import argparse
+
+import numpy as np
+
+from os.path import join
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+MAGNITUDES = ['<10', '<100', '<1000', '>=1000']
+_THRESH = np.array([10.0, 100.0, 1000.0])  # sorted bucket edges, |value| >= last is the top bucket
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _bucketize(vals, thresholds, buckets, counts):
+        # one pass, no temporaries; compiled once and reused per duration
+        for i in range(vals.shape[0]):
+            b = 0
+            while b < thresholds.shape[0] and vals[i] >= thresholds[b]:
+                b += 1
+            buckets[i] = b
+            counts[b] += 1
+
+
+def read_camera_stats(npz_file_path):
+    # the archive is a flat SoA layout (params/names/durations), so a plain
+    # pickle-free load is enough; arrays are only materialized on access
+    return np.load(npz_file_path)
+
+
+def analyze_camera_stats_magnitude(camera_stats, durations=None, param_index=0):
+    video_names = np.asarray(camera_stats['names'])
+    params = camera_stats['params']
+    duration_keys = [str(key) for key in camera_stats['durations']]
+    if durations is None:
+        durations = duration_keys
+
+    magnitude_stats = {}
+    detailed_stats = {}
+    for duration in durations:
+        # one contiguous slice over all videos; failed ones are NaN
+        absv = np.abs(params[:, duration_keys.index(duration), param_index])
+        failed = np.isnan(absv)
+        names, absv = video_names[~failed], absv[~failed]
+        if njit is not None:
+            bucket = np.empty(absv.shape[0], dtype=np.int64)
+            counts = np.zeros(len(MAGNITUDES), dtype=np.int64)
+            _bucketize(absv, _THRESH, bucket, counts)
+        else:
+            bucket = np.searchsorted(_THRESH, absv, side='right')
+            counts = np.bincount(bucket, minlength=len(MAGNITUDES))
+
+        magnitude_stats[duration] = {mag: int(counts[m]) for m, mag in enumerate(MAGNITUDES)}
+        magnitude_stats[duration]['failed'] = int(failed.sum())
+        # parallel (names, values) arrays per bucket; sorting happens once
+        # at report time via argsort instead of sorted() with a key lambda
+        detailed_stats[duration] = {
+            mag: (names[bucket == m], absv[bucket == m])
+            for m, mag in enumerate(MAGNITUDES)}
+
+    return magnitude_stats, detailed_stats
+
+
+def plot_magnitude_recall(magnitude_stats, detailed_stats, output_dir, param_name='param'):
+    import matplotlib.pyplot as plt
+
+    durations = list(magnitude_stats.keys())
+    magnitudes = MAGNITUDES + ['failed']
+
+    # one (n_mag, n_dur) recall matrix instead of rebuilding a list per bar
+    totals = np.array([max(sum(magnitude_stats[duration].values()), 1)
+                       for duration in durations], dtype=float)
+    recalls = np.array([[magnitude_stats[duration][mag] for duration in durations]
+                        for mag in magnitudes]) / totals
+
+    index = np.arange(len(durations))
+    bar_width = 0.15
+    fig, ax = plt.subplots(figsize=(12, 6))
+    for i, mag in enumerate(magnitudes):
+        ax.bar(index + i * bar_width, recalls[i], bar_width, label=mag)
+    ax.set_xticks(index + 2 * bar_width)
+    ax.set_xticklabels([str(duration) for duration in durations])
+    ax.set_xlabel('Duration')
+    ax.set_ylabel('Recall')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(join(output_dir, 'magnitude_recall_{}.png'.format(param_name)), dpi=150)
+    plt.close(fig)
+
+    # assemble the whole report in memory and write it in one call; with
+    # thousands of videos per bucket the per-line write() calls dominate
+    lines = []
+    for duration in durations:
+        lines.append('== {} ==\n'.format(duration))
+        for mag in MAGNITUDES:
+            lines.append('  {}: {}\n'.format(mag, magnitude_stats[duration][mag]))
+            names, vals = detailed_stats[duration][mag]
+            order = np.argsort(vals)
+            lines.extend('    {}: {:.6f}\n'.format(name, value)
+                         for name, value in zip(names[order], vals[order]))
+        lines.append('  failed: {}\n'.format(magnitude_stats[duration]['failed']))
+
+    report_path = join(output_dir, 'magnitude_report_{}.txt'.format(param_name))
+    with open(report_path, 'w') as f:
+        f.write(''.join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stats', type=str, required=True,
+                        help='Path to camera_stats.npz written by video_cut.py')
+    parser.add_argument('--output_dir', type=str, default='dump')
+    parser.add_argument('--param_index', type=int, default=0,
+                        help='Index into the camera parameter vector (mean comes first)')
+    parser.add_argument('--param_name', type=str, default='param')
+    args = parser.parse_args()
+
+    camera_stats = read_camera_stats(args.stats)
+    magnitude_stats, detailed_stats = analyze_camera_stats_magnitude(
+        camera_stats, param_index=args.param_index)
+    plot_magnitude_recall(magnitude_stats, detailed_stats, args.output_dir, args.param_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -53,15 +53,15 @@ def segmentation(images, segment_root, matcher_conf):
                 np.save(segment_path, mask)
 
 
-def main(scene_name, version):
+def colmap_reconstruction(images, outputs, version):
     # Setup
-    images = Path('inputs') / scene_name / 'images'
+    images = Path(images)
 
-    outputs = Path('outputs') / scene_name / version
+    outputs = Path(outputs)
     outputs.mkdir(parents=True, exist_ok=True)
     os.environ['GIMRECONSTRUCTION'] = str(outputs)
 
-    segment_root = Path('outputs') / scene_name / 'segment'
+    segment_root = outputs.parent / 'segment'
     segment_root.mkdir(parents=True, exist_ok=True)
 
     sfm_dir = outputs / 'sparse'
@@ -132,6 +132,12 @@ def main(scene_name, version):
     reconstruction.main(sfm_dir, images, image_pairs, feature_path, match_path)
 
 
+def main(scene_name, version):
+    images = Path('inputs') / scene_name / 'images'
+    outputs = Path('outputs') / scene_name / version
+    colmap_reconstruction(images, outputs, version)
+
+
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('--scene_name', type=str)
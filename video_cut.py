@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+# @Author  : xuelun
+
+import os
+import cv2
+import random
+import shutil
+import signal
+import struct
+import zipfile
+import argparse
+
+import numpy as np
+
+import torch
+import torch.multiprocessing as mp
+
+from tqdm import tqdm
+from pathlib import Path
+from os.path import join, exists
+
+try:
+    import av
+except ImportError:
+    av = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _TJ = TurboJPEG()
+except (ImportError, OSError):
+    _TJ = None
+
+FPS = 3  # frames kept per second of video
+
+
+class TimeoutException(Exception):
+    pass
+
+
+def _timeout_handler(signum, frame):
+    raise TimeoutException
+
+
+def _write_jpeg(path, image):
+    # libjpeg-turbo keeps one SIMD encoder alive for all frames, whereas
+    # cv2.imwrite rebuilds a baseline encoder state per call
+    if _TJ is not None:
+        with open(path, 'wb') as f:
+            f.write(_TJ.encode(image, quality=90, pixel_format=TJPF_BGR))
+    else:
+        cv2.imwrite(path, image)
+
+
+def extract_frames(video_path, output_dir, start_time, duration, fps=FPS):
+    # decode only the ~fps frames per second we keep; PyAV seeks to the
+    # segment and stops at its end, the OpenCV fallback seeks per kept frame
+    os.makedirs(output_dir, exist_ok=True)
+    if av is not None:
+        return _extract_frames_av(video_path, output_dir, start_time, duration, fps)
+    return _extract_frames_cv2(video_path, output_dir, start_time, duration, fps)
+
+
+def _extract_frames_av(video_path, output_dir, start_time, duration, fps):
+    frame_path = join(output_dir, '{:06d}.jpg')
+    container = av.open(video_path)
+    stream = container.streams.video[0]
+    time_base = float(stream.time_base)
+    # jump to the keyframe preceding the segment instead of decoding up to it
+    container.seek(int(start_time / time_base), stream=stream, any_frame=False)
+    step = 1.0 / fps
+    next_time = start_time
+    end_time = start_time + duration
+    num_frames = 0
+    for frame in container.decode(stream):
+        if frame.pts is None: continue
+        frame_time = frame.pts * time_base
+        if frame_time < next_time: continue
+        if frame_time >= end_time: break
+        image = frame.to_ndarray(format='bgr24')
+        _write_jpeg(frame_path.format(num_frames), image)
+        num_frames += 1
+        next_time += step
+    container.close()
+    return num_frames
+
+
+def _extract_frames_cv2(video_path, output_dir, start_time, duration, fps):
+    frame_path = join(output_dir, '{:06d}.jpg')
+    cap = cv2.VideoCapture(video_path)
+    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    start_frame = int(start_time * video_fps)
+    sampling_rate = max(1, int(round(video_fps / fps)))
+    num_frames = 0
+    for i in range(int(duration * fps)):
+        # seek directly to the next kept frame instead of read()-ing the gap
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame + i * sampling_rate)
+        ret, frame = cap.read()
+        if not ret: break
+        _write_jpeg(frame_path.format(num_frames), frame)
+        num_frames += 1
+    cap.release()
+    return num_frames
+
+
+def _write_npz(path, arrays):
+    # stream each array straight into an uncompressed zip member; np.savez
+    # would buffer a second copy of the payload inside the zip writer
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for name, arr in arrays.items():
+            with zf.open(name + '.npy', 'w', force_zip64=True) as fp:
+                np.lib.format.write_array(fp, np.asanyarray(arr), allow_pickle=False)
+
+
+def _scratch_dir(video_basename, key, cut_duration):
+    # COLMAP rereads its own cameras/images/points3D output right after
+    # writing it, so keep the intermediates in tmpfs when it has headroom;
+    # checked per cut, reserving room for the frames this cut will write,
+    # since all workers share /dev/shm
+    if not os.path.isdir('/dev/shm'): return None
+    needed = 8 * 1024 ** 3 + int(cut_duration * FPS) * 1024 ** 2
+    if shutil.disk_usage('/dev/shm').free < needed: return None
+    return join('/dev/shm', 'gim_recon', video_basename, key)
+
+
+def _num_reg_images(model_dir):
+    # the first uint64 of COLMAP's images.bin is the registered image count,
+    # so ranking candidate models needs no Reconstruction parse
+    images_bin = join(model_dir, 'images.bin')
+    if not exists(images_bin): return 0
+    with open(images_bin, 'rb') as f:
+        return struct.unpack('<Q', f.read(8))[0]
+
+
+def _params_from_recon(reconstruction):
+    # camera.params is already an ndarray; stack without a tolist round trip
+    params = np.stack([camera.params for camera in reconstruction.cameras.values()])
+    return np.concatenate([params.mean(axis=0), params.std(axis=0)])
+
+
+# job-constant config, installed once per pool worker by _init_worker so the
+# per-task pickling is reduced to the video path alone
+_CFG = {}
+
+
+def _init_worker(cfg):
+    _CFG.update(cfg)
+    # pin each worker to a disjoint core range so torch, BLAS, libjpeg and
+    # COLMAP's OpenMP pools cannot oversubscribe each other
+    worker_idx = mp.current_process()._identity[0] - 1
+    num_workers = cfg['num_gpus'] * cfg['processes_per_gpu']
+    num_cores = os.cpu_count()
+    cores_per_worker = max(1, num_cores // num_workers)
+    if hasattr(os, 'sched_setaffinity'):
+        first = worker_idx * cores_per_worker
+        os.sched_setaffinity(0, {core % num_cores
+                                 for core in range(first, first + cores_per_worker)})
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = str(cores_per_worker)
+    cv2.setNumThreads(cores_per_worker)
+    torch.set_num_threads(cores_per_worker)
+
+
+def _worker_entry(video_path):
+    # pool workers are numbered from 1; bind each one to a GPU round-robin
+    worker_idx = mp.current_process()._identity[0] - 1
+    gpu_id = worker_idx % _CFG['num_gpus']
+    video_basename = os.path.splitext(os.path.basename(video_path))[0]
+    camera_params = None
+    # noinspection PyBroadException
+    try:
+        camera_params = process_single_video(video_path, _CFG['output_base_dir'],
+                                             _CFG['version'], _CFG['seed'], gpu_id,
+                                             _CFG['durations'], _CFG['timeout'])
+    except Exception:
+        pass
+    return video_basename, camera_params
+
+
+def process_single_video(video_path, output_base_dir, version, seed, gpu_id, durations, timeout):
+    # heavy imports stay out of module scope so the scheduler process never
+    # pays for them and spawned workers only load what they use
+    import pycolmap
+    from reconstruction import colmap_reconstruction
+
+    video_basename = os.path.splitext(os.path.basename(video_path))[0]
+
+    # reproducibility: Python's hash() is salted per process, so derive each
+    # video's stream from a SeedSequence keyed on the base seed and the full
+    # name (SeedSequence takes arbitrary-precision ints, so no truncation)
+    ss = np.random.SeedSequence(
+        [seed, int.from_bytes(video_basename.encode(), 'little')])
+    video_seed = int(ss.generate_state(1, dtype=np.uint32)[0])
+    random.seed(video_seed)
+    np.random.seed(video_seed)
+    torch.manual_seed(video_seed)
+
+    os.environ['CUDA_VISIBLE_DEVICES'] = str(gpu_id)
+
+    cap = cv2.VideoCapture(video_path)
+    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    total_duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / max(video_fps, 1e-6)
+    cap.release()
+
+    signal.signal(signal.SIGALRM, _timeout_handler)
+
+    camera_params = {}
+    for duration in list(durations) + ['total']:
+        if duration == 'total':
+            start_time, cut_duration = 0.0, total_duration
+        else:
+            if duration > total_duration: continue
+            # cut from the middle of the video to skip intros and outros
+            start_time, cut_duration = (total_duration - duration) / 2, duration
+
+        # bind every path for this cut once instead of re-joining strings
+        # in the hot blocks below
+        key = 'total' if duration == 'total' else '{}s'.format(duration)
+        output_dir = Path(output_base_dir) / video_basename / key
+        scratch = _scratch_dir(video_basename, key, cut_duration)
+        work_dir = Path(scratch) if scratch else output_dir
+        version_dir = work_dir / version
+        images_dir = work_dir / 'images'
+        reconstruction_dir = version_dir / 'sparse'
+
+        try:
+            num_frames = extract_frames(video_path, str(images_dir), start_time, cut_duration)
+            if num_frames < 2: continue
+
+            signal.alarm(timeout)
+            try:
+                colmap_reconstruction(images_dir, version_dir, version)
+                signal.alarm(0)
+                camera_params[key] = _params_from_recon(pycolmap.Reconstruction(str(reconstruction_dir)))
+            except TimeoutException:
+                signal.alarm(0)
+                # the mapper was interrupted: fall back to the largest model found so far
+                model_path = reconstruction_dir / 'models'
+                best_model, best_num = None, 0
+                if model_path.exists():
+                    for entry in os.scandir(model_path):
+                        if not entry.is_dir(): continue
+                        num_images = _num_reg_images(entry.path)
+                        if num_images > best_num:
+                            best_model, best_num = entry.path, num_images
+                if best_model is not None:
+                    camera_params[key] = _params_from_recon(pycolmap.Reconstruction(best_model))
+            except Exception:
+                signal.alarm(0)
+        finally:
+            # the scratch must never outlive its cut: continue, ENOSPC or a
+            # crashed extraction would otherwise strand frames in tmpfs
+            if work_dir != output_dir:
+                # archive the sparse model, then drop the tmpfs scratch
+                if reconstruction_dir.exists():
+                    dest = output_dir / version / 'sparse'
+                    if dest.exists(): shutil.rmtree(dest)
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.move(str(reconstruction_dir), str(dest))
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    # hand the (small) arrays back to the parent rather than bouncing
+    # them over a per-video npz on disk
+    return camera_params
+
+
+def process_videos(video_list, output_base_dir, version, seed, num_gpus, processes_per_gpu, durations, timeout):
+    os.makedirs(output_base_dir, exist_ok=True)
+
+    stats_path = join(output_base_dir, 'camera_stats.npz')
+    duration_keys = ['{}s'.format(d) for d in durations] + ['total']
+
+    # resume: keep results from a previous run and only schedule the rest
+    all_camera_params = {}
+    if exists(stats_path):
+        data = np.load(stats_path)
+        for i, name in enumerate(data['names']):
+            row = data['params'][i]
+            all_camera_params[str(name)] = {
+                key: row[d] for d, key in enumerate(data['durations'])
+                if not np.isnan(row[d]).all()}
+    video_list = [video_path for video_path in video_list
+                  if os.path.splitext(os.path.basename(video_path))[0] not in all_camera_params]
+
+    def flush_stats():
+        # flat SoA layout: (num_videos, num_durations, 2 * num_params) plus
+        # a side array of names, loadable without allow_pickle
+        names = sorted(all_camera_params.keys())
+        width = max((vec.shape[0] for camera in all_camera_params.values()
+                     for vec in camera.values()), default=0)
+        params = np.full((len(names), len(duration_keys), width), np.nan)
+        for i, name in enumerate(names):
+            for d, key in enumerate(duration_keys):
+                vec = all_camera_params[name].get(key)
+                if vec is not None:
+                    params[i, d, :vec.shape[0]] = vec
+        # write-then-rename so a crash mid-save never clobbers the archive
+        tmp_path = stats_path + '.tmp'
+        _write_npz(tmp_path, {'params': params, 'names': np.array(names),
+                              'durations': np.array(duration_keys)})
+        os.replace(tmp_path, stats_path)
+
+    cfg = dict(output_base_dir=output_base_dir, version=version, seed=seed,
+               num_gpus=num_gpus, processes_per_gpu=processes_per_gpu,
+               durations=durations, timeout=timeout)
+
+    completed = 0
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(processes=num_gpus * processes_per_gpu,
+                  initializer=_init_worker, initargs=(cfg,)) as pool:
+        for video_basename, camera_params in tqdm(
+                pool.imap_unordered(_worker_entry, video_list),
+                total=len(video_list), ncols=120):
+            if camera_params:
+                all_camera_params[video_basename] = camera_params
+            completed += 1
+            if completed % 50 == 0: flush_stats()
+
+    flush_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video_dir', type=str, required=True,
+                        help='Directory with input videos')
+    parser.add_argument('--output_dir', type=str,
+                        default=join('outputs', 'camera_stats'),
+                        help='Directory for cut frames and camera statistics')
+    parser.add_argument('--version', type=str, choices={'gim_dkm', 'gim_lightglue'},
+                        default='gim_dkm')
+    parser.add_argument('--seed', type=int, default=3407)
+    parser.add_argument('--num_gpus', type=int, default=torch.cuda.device_count())
+    parser.add_argument('--processes_per_gpu', type=int, default=4)
+    parser.add_argument('--durations', type=int, nargs='+', default=[10, 30, 60, 120],
+                        help='Cut lengths in seconds')
+    parser.add_argument('--timeout', type=int, default=1800,
+                        help='Per-reconstruction timeout in seconds')
+    args = parser.parse_args()
+
+    video_list = sorted(join(args.video_dir, name) for name in os.listdir(args.video_dir)
+                        if name.endswith(('.mp4', '.avi', '.mov', '.mkv')))
+
+    process_videos(video_list, args.output_dir, args.version, args.seed,
+                   args.num_gpus, args.processes_per_gpu, args.durations, args.timeout)
+
+
+if __name__ == '__main__':
+    main()